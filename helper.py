@@ -1,14 +1,20 @@
 """
 Helper module for Data-Science-Keras repository
 """
-import os, warnings
+import os, sys, warnings
 warnings.simplefilter(action="ignore", category=FutureWarning)
 
 from time import time
+from functools import lru_cache
 import random as rn
 import math
 
-
+import matplotlib
+# headless linux (no display, no jupyter kernel, no backend chosen): avoid loading a GUI backend
+if (sys.platform.startswith('linux') and not os.environ.get('DISPLAY')
+        and not os.environ.get('WAYLAND_DISPLAY') and 'MPLBACKEND' not in os.environ
+        and 'ipykernel' not in sys.modules):
+    matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -33,44 +39,83 @@ def info_gpu():
     print('TensorFlow\tv{}'.format(tf.__version__))
 
 
-def reproducible(seed=42):
-    import tensorflow as tf
-    import keras
+def reproducible(seed=42, strict=False):
     """ Setup reproducible results from run to run using Keras
     https://keras.io/getting-started/faq/#how-can-i-obtain-reproducible-results-using-keras-during-development
+    Multiple threads are a potential source of non-reproducible results: use strict=True to run
+    TensorFlow in a single thread (slower)
     """
+    import tensorflow as tf
 
     os.environ['PYTHONHASHSEED'] = '0'
     np.random.seed(seed)
     rn.seed(seed)
-    # Multiple threads are a potential source of non-reproducible results.
-    session_conf = tf.ConfigProto(
-        intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
-    tf.set_random_seed(seed)
-    sess = tf.Session(graph=tf.get_default_graph(), config=session_conf)
-    keras.backend.set_session(sess)
+
+    if hasattr(tf, 'set_random_seed'):  # TensorFlow 1.x
+        tf.set_random_seed(seed)
+        if strict:
+            import keras
+            session_conf = tf.ConfigProto(
+                intra_op_parallelism_threads=1, inter_op_parallelism_threads=1)
+            sess = tf.Session(graph=tf.get_default_graph(), config=session_conf)
+            keras.backend.set_session(sess)
+
+    else:
+        tf.random.set_seed(seed)
+        if strict:
+            tf.config.threading.set_intra_op_parallelism_threads(1)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
 
 
 # DATA PROCESSING ------------------------------------------------
 
 
+def _split_columns(df, target=None):
+    """ Return (numerical, non-numerical) column lists of df in a single pass over its dtypes.
+    Target columns are excluded """
+
+    if target is None:
+        target = []
+
+    kinds = np.array([dt.kind for dt in df.dtypes])
+    # same columns as select_dtypes(include=[np.number]), which includes timedelta ('m')
+    is_numerical = np.isin(kinds, list('iufcm'))
+
+    numerical_f = [c for c, n in zip(df.columns, is_numerical) if n and c not in target]
+    categorical_f = [c for c, n in zip(df.columns, is_numerical) if not n and c not in target]
+
+    return numerical_f, categorical_f
+
+
 def force_categorical(df):
     """ Force non numerical fields to pandas 'category' type """
-    non_numerical = list(df.select_dtypes(exclude=[np.number]))
+    _, non_numerical = _split_columns(df)
 
     fields_to_change = [
-        f for f in df if f in non_numerical and df[f].dtype.name != 'category'
+        f for f in non_numerical if not isinstance(df[f].dtype, pd.CategoricalDtype)
     ]
 
-    for f in fields_to_change:
-        df[f] = df[f].astype('category')
-
     if fields_to_change:
+        # single block assignment: df is still modified in place
+        df[fields_to_change] = df[fields_to_change].astype('category')
         print("Non-numerical fields changed to 'category':", fields_to_change)
 
     return df
 
 
+@lru_cache(maxsize=32)
+def _us_holidays(first_year, last_year):
+    """ Return the US federal holidays between first_year and last_year as a datetime64[D] array """
+    from pandas.tseries.holiday import USFederalHolidayCalendar as calendar
+
+    holidays = calendar().holidays(
+        start='{}-01-01'.format(first_year), end='{}-12-31'.format(last_year))
+    holidays = np.asarray(holidays.values, dtype='datetime64[D]')
+    holidays.flags.writeable = False  # shared between calls
+
+    return holidays
+
+
 def expand_date(timeseries):
     """
     Expand a pandas datetime series returning a dataframe with these columns:
@@ -82,30 +127,58 @@ def expand_date(timeseries):
     - workingday : 0 weekend or holiday - 1 workingday
 
     """
-    from pandas.tseries.holiday import USFederalHolidayCalendar as calendar
-
     assert type(
         timeseries) == pd.core.series.Series, 'input must be pandas series'
     assert timeseries.dtypes == 'datetime64[ns]', 'input must be pandas datetime'
 
-    df = pd.DataFrame()
+    di = pd.DatetimeIndex(timeseries.values)
 
-    df['hour'] = timeseries.dt.hour
+    df = pd.DataFrame(index=timeseries.index)
 
-    date = timeseries.dt.date
-    df['year'] = pd.DatetimeIndex(date).year
-    df['month'] = pd.DatetimeIndex(date).month
-    df['day'] = pd.DatetimeIndex(date).day
-    df['weekday'] = pd.DatetimeIndex(date).weekday
+    df['hour'] = di.hour
+    df['year'] = di.year
+    df['month'] = di.month
+    df['day'] = di.day
+    df['weekday'] = di.weekday
 
-    holidays = calendar().holidays(start=date.min(), end=date.max())
-    hol = date.astype('datetime64[ns]').isin(holidays)
-    df['holiday'] = hol.values.astype(int)
-    df['workingday'] = ((df['weekday'] < 5) & (df['holiday'] == 0)).astype(int)
+    day = di.normalize().values.astype('datetime64[D]')
+    holidays = _us_holidays(di.year.min(), di.year.max())
+    df['holiday'] = np.isin(day, holidays).astype(np.int8)
+    df['workingday'] = ((di.weekday < 5) & (df['holiday'] == 0)).astype(np.int8)
 
     return df
 
 
+def _smallest_dtype(data):
+    """
+    Return the smallest dtype for the numerical values of the input series, read from its
+    min/max without converting it: integer of the same signedness (never wider than the current
+    one) for integers, float32 otherwise
+    """
+    # pandas nullable numerical types: Int64, Float64, ...
+    nullable = not isinstance(data.dtype, np.dtype) and pd.api.types.is_numeric_dtype(data.dtype)
+    dtype = np.dtype(np.float32)
+
+    if pd.api.types.is_integer_dtype(data.dtype):
+        dtype = data.dtype
+        current = np.dtype(dtype.numpy_dtype if nullable else dtype)
+        candidates = (np.uint8, np.uint16, np.uint32) if current.kind == 'u' else (
+            np.int8, np.int16, np.int32)
+        low, high = data.min(), data.max()
+        if pd.notnull(low):
+            for candidate in candidates:
+                info = np.iinfo(candidate)
+                if np.dtype(candidate).itemsize >= current.itemsize:
+                    break
+                if info.min <= low and high <= info.max:
+                    dtype = np.dtype(candidate)
+                    break
+
+    if nullable and isinstance(dtype, np.dtype):
+        return dtype.name.capitalize().replace('Uint', 'UInt')  # e.g. 'Int8', 'UInt8', 'Float32'
+    return dtype
+
+
 def classify_data(df, target, numerical=None, categorical=None):
     """  Return a new dataframe with categorical variables as dtype 'categorical' and sorted
     columns: numerical + categorical + target.
@@ -114,8 +187,6 @@ def classify_data(df, target, numerical=None, categorical=None):
     Output: classified and sorted dataframe
     """
 
-    df = df.copy()
-
     assert numerical or categorical, "Numerical or categorical variable list must be provided"
 
     if not categorical:
@@ -126,16 +197,16 @@ def classify_data(df, target, numerical=None, categorical=None):
     numerical_f = [col for col in numerical if col not in target]
     categorical_f = [col for col in categorical if col not in target]
 
-    # sort columns of dataframe
+    # sort columns of dataframe (new dataframe: no copy of the input needed)
     df = df[numerical_f + categorical_f + target]
 
-    # assign float data type to numerical columns
-    for n in df[numerical]:
-        df[n] = df[n].astype(np.float32)
+    # assign the smallest numerical subtype (integer or float) to numerical columns
+    dtypes = {n: _smallest_dtype(df[n]) for n in numerical}
 
     # assign category data type to categorical columns (force_categorical not needed)
-    for f in df[categorical]:
-        df[f] = df[f].astype('category')
+    dtypes.update({f: 'category' for f in categorical})
+
+    df = df.astype(dtypes)
 
     print('Numerical features: \t{}'.format(len(numerical_f)))
     print('Categorical features: \t{}'.format(len(categorical_f)))
@@ -164,27 +235,86 @@ def remove_lowfreq(df, target=None, ratio=0.01, show=False, inplace=False):
         target = []
 
     df = force_categorical(df)
-    categorical = df.select_dtypes(include=['category'])
-    categorical_f = [c for c in categorical if c not in target]
+    _, categorical_f = _split_columns(df, target)
 
     if not categorical_f:
         print('None categorical variables found')
 
-    for f in categorical_f:
+    df = _drop_lowfreq_categories(df, categorical_f, threshold)
 
-        count = df[f].value_counts()
-        low_freq = list(count[count < threshold].index)
-        if len(low_freq) > 0:
-            df[f] = df[f].replace(low_freq, np.nan)
-            df[f].cat.remove_unused_categories(inplace=True)
-            # df.loc[:,f] = df.loc[:,f].replace(np.low_freq, np.nan)
-        if show:
+    if show:
+        for f in categorical_f:
             print(f, dict(df[f].value_counts()))
 
     if not inplace:
         return df
 
 
+@lru_cache(maxsize=None)
+def _lowfreq_kernel():
+    """ Return the numba-compiled low frequency kernel, or None if numba is not installed """
+    try:
+        from numba import njit, prange
+    except ImportError:
+        return None
+
+    @njit(parallel=True, cache=True)  # compiled once, reused by later processes
+    def kernel(codes, n_categories, threshold, mask):
+        for j in prange(codes.shape[0]):
+            count = np.zeros(n_categories[j], dtype=np.int64)
+            for i in range(codes.shape[1]):
+                if codes[j, i] >= 0:
+                    count[codes[j, i]] += 1
+            for i in range(codes.shape[1]):
+                c = codes[j, i]
+                mask[j, i] = c >= 0 and count[c] < threshold
+
+    return kernel
+
+
+def _lowfreq_mask(codes, n_categories, threshold):
+    """
+    Return a boolean mask of the category codes (2D array, one row per feature) whose category
+    appears less than 'threshold' times in its feature. Numba is used for large datasets if available
+    """
+    mask = np.zeros(codes.shape, dtype=bool)
+
+    # np.bincount is already faster on small datasets
+    kernel = _lowfreq_kernel() if codes.shape[1] >= 100000 else None
+    if kernel is not None:
+        kernel(codes, n_categories, threshold, mask)
+        return mask
+
+    for j in range(codes.shape[0]):
+        c = codes[j]
+        count = np.bincount(c[c >= 0], minlength=n_categories[j])
+        # extra False entry for the NaN code (-1)
+        mask[j] = np.append(count < threshold, False)[c]
+
+    return mask
+
+
+def _drop_lowfreq_categories(df, categorical_f, threshold):
+    """
+    Replace by NaN the values of the categorical features appearing less than 'threshold' times.
+    Each feature is rebuilt once from its category codes
+    """
+    if not categorical_f:
+        return df
+
+    # integer codes of all categorical features (one row per feature, -1 is NaN)
+    codes = np.vstack([df[f].cat.codes.values for f in categorical_f]).astype(np.int32)
+    n_categories = np.array([len(df[f].cat.categories) for f in categorical_f])
+    low_freq = _lowfreq_mask(codes, n_categories, threshold)
+
+    for idx, f in enumerate(categorical_f):
+        new_codes = np.where(low_freq[idx], -1, codes[idx])
+        df[f] = pd.Categorical.from_codes(
+            new_codes, dtype=df[f].dtype).remove_unused_categories()
+
+    return df
+
+
 def remove_categories(df,
                       target=None,
                       ratio=0.01,
@@ -204,27 +334,21 @@ def remove_categories(df,
         target = []
 
     df = force_categorical(df)
-    categorical = df.select_dtypes(include=['category'])
-    categorical_f = [c for c in categorical if c not in target]
+    _, categorical_f = _split_columns(df, target)
 
     if not categorical_f:
         print('None categorical variables found')
 
     if dict_categories:
         for f in categorical_f:
-            df[f].cat.set_categories(dict_categories[f], inplace=True)
+            df[f] = df[f].cat.set_categories(dict_categories[f])
 
     else:
         dict_categories = dict()
 
-        for f in categorical_f:
+        df = _drop_lowfreq_categories(df, categorical_f, threshold)
 
-            count = df[f].value_counts()
-            low_freq = list(count[count < threshold].index)
-            if low_freq:
-                df[f] = df[f].replace(low_freq, np.nan)
-                df[f].cat.remove_unused_categories(inplace=True)
-                # df.loc[:,f] = df.loc[:,f].replace(np.low_freq, np.nan)
+        for f in categorical_f:
 
             dict_categories[f] = df[f].cat.categories
 
@@ -234,18 +358,33 @@ def remove_categories(df,
     return df, dict_categories
 
 
-def remove_outliers(df, sigma=3, inplace=False):
+def remove_outliers(df, sigma=3, inplace=False, dtype=None):
     """
     Remove outliers from numerical variables
+    Values further than 'sigma' standard deviations from the mean are replaced by NaN
+    The float type of the numerical block is used by default (dtype=None)
+    Only columns with outliers are modified: integer columns become float
     """
     if not inplace:
         df = df.copy()
 
-    num_df = df.select_dtypes(include=[np.number])
-    # col = list(num_df)
-    df[num_df.columns] = num_df[np.abs(num_df - num_df.mean()) <=
-                                (sigma * num_df.std())]
-    print(list(num_df))
+    numerical, _ = _split_columns(df)
+    if dtype is None:
+        dtype = np.result_type(
+            np.float32, *[df[n].dtype for n in numerical if isinstance(df[n].dtype, np.dtype)])
+    x = df[numerical].to_numpy(dtype, na_value=np.nan)
+
+    mean, std = np.nanmean(x, axis=0), np.nanstd(x, axis=0, ddof=1)
+    outlier = np.abs(x - mean) > sigma * std
+
+    for idx in np.flatnonzero(outlier.any(axis=0)):
+        n = numerical[idx]
+        values = np.where(outlier[:, idx], np.nan, x[:, idx])
+        # keep float and nullable types (Float32, Int64, ...) of the original column
+        if df[n].dtype.kind == 'f' or not isinstance(df[n].dtype, np.dtype):
+            values = pd.Series(values, index=df.index).astype(df[n].dtype)
+        df[n] = values
+    print(numerical)
 
     if not inplace:
         return df
@@ -259,7 +398,12 @@ def missing(df, limit=None, figsize=None, plot=True):
     """
 
     size = df.shape[0]
-    m = df.isnull().sum()
+    if (df.dtypes.nunique() == 1 and isinstance(df.dtypes.iloc[0], np.dtype)
+            and df.dtypes.iloc[0].kind == 'f'):
+        # homogeneous float block: single reduction over the 2D array
+        m = pd.Series(np.isnan(df.values).sum(axis=0), index=df.columns)
+    else:
+        m = df.isnull().sum()
     m = m[m > 0]
     if m.empty:
         print("No missing values found")
@@ -313,38 +457,52 @@ def fill_simple(df,
     if not inplace:
         df = df.copy()
 
-    numerical = list(df.select_dtypes(include=[np.number]))
-    numerical_f = [col for col in numerical if col not in target]
-    categorical_f = [
-        col for col in df if col not in numerical and col not in target
-    ]
+    df = force_categorical(df)
+    numerical_f, categorical_f = _split_columns(df, target)
 
     # numerical
 
-    if include_numerical:
-        for f in numerical_f:
-            if missing_numerical == 'median':
-                df[f].fillna(df[f].median(), inplace=True)
-            elif missing_numerical == 'mean':
-                df[f].fillna(df[f].mean(), inplace=True)
-            else:
-                warnings.warn("missing_numerical must be 'mean' or 'median'")
-                print('Missing numerical filled with: {}'.format(
-                    missing_numerical))
+    if include_numerical and numerical_f:
+        if missing_numerical in ('median', 'mean'):
+            has_missing = df[numerical_f].isna().any()
+            missing_f = [f for f in numerical_f if has_missing[f]]
+
+            # NumPy columns: fill them as 2D blocks (one per dtype)
+            blocks = [f for f in missing_f if isinstance(df[f].dtype, np.dtype)]
+            reduce = np.nanmedian if missing_numerical == 'median' else np.nanmean
+            for dtype in set(df[blocks].dtypes):
+                block = [f for f in blocks if df[f].dtype == dtype]
+                x = df[block].to_numpy(dtype)
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore', RuntimeWarning)  # all-NaN columns
+                    fill = reduce(x, axis=0)
+                df[block] = np.where(np.isnan(x), fill, x)
+
+            # nullable extension columns (Int64, Float64, ...)
+            extension = [f for f in missing_f if f not in blocks]
+            if extension:
+                fill = getattr(df[extension], missing_numerical)()
+                # nullable integers only accept integer fill values
+                fill = {f: round(v) if df[f].dtype.kind in 'iu' and pd.notnull(v) else v
+                        for f, v in fill.items()}
+                df.fillna(fill, inplace=True)
+        else:
+            warnings.warn("missing_numerical must be 'mean' or 'median'")
+            print('Missing numerical filled with: {}'.format(
+                missing_numerical))
 
     # categorical
 
-    if include_categorical:
+    if include_categorical and categorical_f:
 
         if missing_categorical == 'mode':
-            modes = df[categorical_f].mode()
-            for idx, f in enumerate(df[categorical_f]):
-                df[f].fillna(modes.iloc[0, idx], inplace=True)
+            modes = df[categorical_f].mode().iloc[0]
+            df.fillna(modes.to_dict(), inplace=True)
         else:
             for f in categorical_f:
                 if missing_categorical not in df[f].cat.categories:
-                    df[f].cat.add_categories(missing_categorical, inplace=True)
-                df[f].fillna(missing_categorical, inplace=True)
+                    df[f] = df[f].cat.add_categories(missing_categorical)
+            df.fillna({f: missing_categorical for f in categorical_f}, inplace=True)
             print('Missing categorical filled with label: "{}"'.format(
                 missing_categorical))
 
@@ -395,8 +553,7 @@ def show_numerical(df, target=None, kde=False, sharey=False, figsize=(17, 2), nc
     if target is None:
         target = []
 
-    numerical = list(df.select_dtypes(include=[np.number]))
-    numerical_f = [n for n in numerical if n not in target]
+    numerical_f, _ = _split_columns(df, target)
 
     if not numerical_f:
         print("There are no numerical features")
@@ -433,7 +590,7 @@ def show_target_vs_numerical(df,
         Target values must be parsed to numbers
     """
 
-    numerical = list(df.select_dtypes(include=[np.number]))
+    numerical, _ = _split_columns(df)
     numerical_f = [n for n in numerical if n not in target]
 
     if ncols <= 1:
@@ -444,13 +601,9 @@ def show_target_vs_numerical(df,
         print("There are no numerical features")
         return
 
-    df = df.copy()
-
-    for t in target:
-        if t not in numerical:
-            df[t] = df[t].astype(
-                np.float16
-            )  # force categorical values to numerical (booleans, ...)
+    # copy only the plotted columns, forcing categorical targets to numerical (booleans, ...)
+    df = df[numerical_f + target].astype(
+        {t: np.float16 for t in target if t not in numerical})
 
     nrows = math.ceil(len(numerical_f)/ncols)
 
@@ -499,6 +652,17 @@ def show_target_vs_numerical(df,
 
 
 
+def _order(data):
+    """ Return the sorted non-null values of the input series to order the plots """
+    if isinstance(data.dtype, pd.CategoricalDtype):
+        # categories present in the data only (sorted unless the categorical is ordered)
+        categories, codes = data.cat.categories, data.cat.codes.values
+        count = np.bincount(codes[codes >= 0], minlength=len(categories))
+        present = categories[count > 0].tolist()
+        return present if data.cat.ordered else sorted(present)
+    return sorted(data.dropna().unique().tolist())
+
+
 def show_categorical(df, target=None, sharey=False, figsize=(17, 2), ncols=5):
     """
     Display histograms of categorical features
@@ -511,10 +675,7 @@ def show_categorical(df, target=None, sharey=False, figsize=(17, 2), ncols=5):
         ncols =5
         print( "Number of columns changed to {}".format(ncols))
 
-    numerical = list(df.select_dtypes(include=[np.number]))
-    categorical_f = [
-        col for col in df if col not in numerical and col not in target
-    ]
+    _, categorical_f = _split_columns(df, target)
 
     if not categorical_f:
         print("There are no categorical variables")
@@ -538,7 +699,7 @@ def show_categorical(df, target=None, sharey=False, figsize=(17, 2), ncols=5):
             _, ax = plt.subplots(ncols=ncols, sharey=sharey, figsize=figsize)
 
             for idx, n in enumerate(categorical_f[row * ncols : row * ncols + ncols]):
-                so = sorted({v for v in df[n].values if str(v) != 'nan'})
+                so = _order(df[n])
                 axs = sns.countplot(df[n].dropna(), ax=ax[idx], order=so)
                 if idx != 0:
                     axs.set(ylabel='')
@@ -551,10 +712,8 @@ def show_target_vs_categorical(df, target, figsize=(17, 4), ncols=5):
     Target values must be numerical for barplots
     """
 
-    numerical = list(df.select_dtypes(include=[np.number]))
-    categorical_f = [
-        col for col in df if col not in numerical and col not in target
-    ]
+    numerical, categorical = _split_columns(df)
+    categorical_f = [col for col in categorical if col not in target]
     
     
     if ncols <= 1:
@@ -566,11 +725,9 @@ def show_target_vs_categorical(df, target, figsize=(17, 4), ncols=5):
         print("There are no categorical variables")
         return
 
-    copy_df = df.copy()
-    for t in target:
-        copy_df = copy_df[pd.notnull(copy_df[t])]
-        if t not in numerical:
-            copy_df[t] = copy_df[t].astype(np.float16)
+    # copy only the plotted columns (and rows with target values)
+    copy_df = df[categorical_f + target].dropna(subset=target)
+    copy_df = copy_df.astype({t: np.float16 for t in target if t not in numerical})
             
     nrows = math.ceil(len(categorical_f)/ncols)
 
@@ -592,7 +749,7 @@ def show_target_vs_categorical(df, target, figsize=(17, 4), ncols=5):
 
                 for idx, f in enumerate(categorical_f[row * ncols : row * ncols + ncols]):
  
-                    so = sorted({v for v in copy_df[f].values if str(v) != 'nan'})
+                    so = _order(copy_df[f])
 
                     axs = sns.barplot(data=copy_df, x=f, y=t, ax=ax[idx], order=so)
 
@@ -601,6 +758,28 @@ def show_target_vs_categorical(df, target, figsize=(17, 4), ncols=5):
                         axs.set(ylabel='')
 
 
+def _pearson(x, y):
+    """
+    Return the Pearson correlation coefficients between the columns of the 2D arrays x and y
+    Missing values (NaN) are excluded pairwise, as in DataFrame.corr
+    """
+    # centering does not change the coefficients but improves numerical accuracy
+    x = x - np.nanmean(x, axis=0)
+    y = y - np.nanmean(y, axis=0)
+
+    mx, my = (~np.isnan(x)).astype(np.float64), (~np.isnan(y)).astype(np.float64)
+    x, y = np.nan_to_num(x), np.nan_to_num(y)
+
+    # sums over the rows with both values available for each pair of columns
+    n = mx.T @ my
+    sx, sy = x.T @ my, mx.T @ y
+    sxx, syy = (x * x).T @ my, mx.T @ (y * y)
+    sxy = x.T @ y
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (n * sxy - sx * sy) / np.sqrt((n * sxx - sx**2) * (n * syy - sy**2))
+
+
 def correlation(df, target, limit=0, figsize=None, plot=True):
     """ 
     Display Pearson correlation coefficient between target and numerical features
@@ -608,30 +787,31 @@ def correlation(df, target, limit=0, figsize=None, plot=True):
 
     """
 
-    numerical = list(df.select_dtypes(include=[np.number]))
+    numerical, _ = _split_columns(df)
     numerical_f = [n for n in numerical if n not in target]
 
     if not numerical_f:
         print("There are no numerical features")
         return
 
-    copy_df = df.copy()
-    for t in target:
-        if t not in numerical:
-            copy_df[t] = copy_df[t].astype(np.float16)
+    x = df[numerical_f].to_numpy(np.float64, na_value=np.nan)
+    # force categorical targets to numerical (booleans, ...)
+    y = df[target].to_numpy(np.float64, na_value=np.nan)
 
-    corr = copy_df.corr().loc[numerical_f, target].fillna(0).sort_values(target, ascending=False).round(2)
+    corr = pd.DataFrame(_pearson(x, y), index=numerical_f, columns=target)
+    corr = corr.fillna(0).sort_values(target, ascending=False).round(2)
 
-    if not figsize:
-        figsize = (8, len(numerical_f) // 2 + 1) 
-    corr.plot.barh(figsize=figsize)
-    plt.gca().invert_yaxis()
-    
-    if limit>0:
-        plt.axvline(x=-limit, color='k', linestyle='--', )
-        plt.axvline(x=limit, color='k', linestyle='--', )
-    plt.xlabel('Pearson correlation coefficient')
-    plt.ylabel('feature')
+    if plot:
+        if not figsize:
+            figsize = (8, len(numerical_f) // 2 + 1)
+        corr.plot.barh(figsize=figsize)
+        plt.gca().invert_yaxis()
+
+        if limit>0:
+            plt.axvline(x=-limit, color='k', linestyle='--', )
+            plt.axvline(x=limit, color='k', linestyle='--', )
+        plt.xlabel('Pearson correlation coefficient')
+        plt.ylabel('feature')
 
     if limit:
         return corr.loc[abs(corr[target[0]]) < abs(limit)].index.tolist()
@@ -664,43 +844,35 @@ def scale(data, scale_param=None, method='std'):
 
     data = data.copy()
 
-    num = list(data.select_dtypes(include=[np.number]))
+    num, _ = _split_columns(data)
+    x = data[num].to_numpy(np.float64, na_value=np.nan)
+
     if not scale_param:
+        # (mean, std) for 'std', (min, max) for 'minmax' and 'maxabs'
+        if method == 'std':
+            p0, p1 = np.nanmean(x, axis=0), np.nanstd(x, axis=0, ddof=1)
+        else:
+            p0, p1 = np.nanmin(x, axis=0), np.nanmax(x, axis=0)
+        scale_param = {f: [a, b] for f, a, b in zip(num, p0.tolist(), p1.tolist())}
         create_scale = True
-        scale_param = {}
     else:
+        p0 = np.array([scale_param[f][0] for f in num], dtype=np.float64)
+        p1 = np.array([scale_param[f][1] for f in num], dtype=np.float64)
         create_scale = False
 
-    for f in num:
-        if method == 'std':
-            if create_scale:
-                mean, std = data[f].mean(), data[f].std()
-                data[f] = (data[f].values - mean) / std
-                scale_param[f] = [mean, std]
-            else:
-                data.loc[:, f] = (
-                    data[f] - scale_param[f][0]) / scale_param[f][1]
-
-        elif method == 'minmax':
+    if method == 'std':
+        x = (x - p0) / p1
 
-            if create_scale:
-                min, max = data[f].min(), data[f].max()
-                data[f] = (data[f].values - min) / (max - min)
-                scale_param[f] = [min, max]
-            else:
-                min, max = scale_param[f][0], scale_param[f][1]
-                data.loc[:, f] = (data[f].values - min) / (max - min)
+    elif method == 'minmax':
+        x = (x - p0) / (p1 - p0)
 
-        elif method == 'maxabs':
+    elif method == 'maxabs':
+        if create_scale:
+            x = 2 * (x - p0) / (p1 - p0) - 1
+        else:
+            x = 0.5 * (x * (p1 - p0) + p1 + p0)
 
-            if create_scale:
-                min, max = data[f].min(), data[f].max()
-                data[f] = 2 * (data[f].values - min) / (max - min) - 1
-                scale_param[f] = [min, max]
-            else:
-                min, max = scale_param[f][0], scale_param[f][1]
-                data.loc[:, f] = 0.5 * (data[f].values *
-                                        (max - min) + max + min)
+    data[num] = x.astype(np.float32)
 
     return data, scale_param
 
@@ -727,43 +899,30 @@ def replace_by_dummies(data, target, dummies=None, drop_first=False):
     Output: dataframe with categorical replaced by dummies, dummy dictionary
      """
 
-    data = data.copy()
-
     if not dummies:
         create_dummies = True
     else:
         create_dummies = False
 
-    found_dummies = []
-
-    categorical = list(data.select_dtypes(include=['category']))
-    categorical_f = [col for col in categorical if col not in target]
-
-    for f in categorical_f:
-        dummy = pd.get_dummies(data[f], prefix=f, drop_first=drop_first)
-        data = pd.concat([data, dummy], axis=1)
-        data.drop(f, axis=1, inplace=True)
+    categorical_f = [
+        col for col, dtype in data.dtypes.items()
+        if isinstance(dtype, pd.CategoricalDtype) and col not in target
+    ]
+    other = [col for col in data if col not in categorical_f]
 
-        found_dummies.extend(dummy)
+    # single encoding into a new dataframe: dummies are appended after the other columns
+    data = pd.get_dummies(data, columns=categorical_f, drop_first=drop_first)
+    found_dummies = [col for col in data if col not in other]
 
     if not create_dummies:
-
-        # remove new dummies not in given dummies
-        new = set(found_dummies) - set(dummies)
-        for n in new:
-            data.drop(n, axis=1, inplace=True)
-
-        # fill missing dummies with empty values (0)
-        missing = set(dummies) - set(found_dummies)
-        for m in missing:
-            data[m] = 0
+        # remove new dummies not in given dummies and fill missing ones with empty values (0)
+        data = data.reindex(columns=other + list(dummies), fill_value=0)
 
     else:
         dummies = found_dummies
 
     # set new columns to category
-    for dummy in dummies:
-        data[dummy] = data[dummy].astype('category')
+    data[dummies] = data[dummies].astype('category')
 
     return data, dummies
 
@@ -1085,17 +1244,33 @@ def XGBClassifier(x_train,
     return clf
 
 
+def _fit_predict(model, x_train, y_train, x_test, proba=False):
+    """ Fit the model and return (training time, predictions on x_test) """
+
+    warnings.filterwarnings("ignore", message="overflow encountered in reduce")
+
+    t0 = time()
+    model.fit(x_train, y_train)
+    train_time = time() - t0
+
+    if proba:
+        return train_time, model.predict_proba(x_test)
+    return train_time, model.predict(x_test)
+
+
 def ml_classification(x_train,
                       y_train,
                       x_test,
                       y_test,
                       cross_validation=False,
-                      show=False):
+                      show=False,
+                      n_jobs=-1):
     """
     Build, train, and test the data set with classical machine learning classification models.
+    The models are trained in parallel using 'n_jobs' processes.
     If cross_validation=True an additional training with cross validation will be performed.
     """
-    from time import time
+    from joblib import Parallel, delayed
     from sklearn.tree import DecisionTreeClassifier
     from sklearn.naive_bayes import GaussianNB
     from sklearn.ensemble import AdaBoostClassifier, RandomForestClassifier, ExtraTreesClassifier
@@ -1104,8 +1279,8 @@ def ml_classification(x_train,
     # from sklearn.base import clone
 
     classifiers = (GaussianNB(), AdaBoostClassifier(),
-                   DecisionTreeClassifier(), RandomForestClassifier(100),
-                   ExtraTreesClassifier(100))
+                   DecisionTreeClassifier(), RandomForestClassifier(100, n_jobs=1),
+                   ExtraTreesClassifier(100, n_jobs=1))
 
     names = [
         "Naive Bayes", "AdaBoost", "Decision Tree", "Random Forest",
@@ -1116,25 +1291,19 @@ def ml_classification(x_train,
         'Time (s)', 'Loss', 'Accuracy', 'Precision', 'Recall', 'ROC-AUC',
         'F1-score'
     ]
-    results = pd.DataFrame(columns=col)
+    rows = []
 
-    for idx, clf in enumerate(classifiers):
+    # Fitting the models without cross validation
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_predict)(clf, x_train, y_train, x_test, proba=True)
+        for clf in classifiers)
+
+    for name, (train_time, y_pred) in zip(names, fitted):
 
         # clf_cv = clone(clf)
 
-        name = names[idx]
         print(name)
 
-        t0 = time()
-        # Fitting the model without cross validation
-
-        warnings.filterwarnings(
-            "ignore", message="overflow encountered in reduce")
-
-        clf.fit(x_train, y_train)
-        train_time = time() - t0
-        y_pred = clf.predict_proba(x_test)
-
         loss, acc, pre, rec, roc, f1 = binary_classification_scores(
             y_test, y_pred[:, 1], show=show)
 
@@ -1155,11 +1324,9 @@ def ml_classification(x_train,
             # print("Test Accuracy CV:\t {:.3f}".format(accuracy_cv))
             # print("Training Time CV: \t {:.1f} ms".format(train_time_cv * 1000))
 
-        results = results.append(
-            pd.DataFrame(
-                [[train_time, loss, acc, pre, rec, roc, f1]],
-                columns=col,
-                index=[name]))
+        rows.append([train_time, loss, acc, pre, rec, roc, f1])
+
+    results = pd.DataFrame(rows, columns=col, index=names)
 
     return results.sort_values('Accuracy', ascending=False).round(2)
 
@@ -1169,12 +1336,14 @@ def ml_regression(x_train,
                   x_test,
                   y_test,
                   cross_validation=False,
-                  show=False):
+                  show=False,
+                  n_jobs=-1):
     """
     Build, train, and test the data set with classical machine learning regression models.
+    The models are trained in parallel using 'n_jobs' processes.
     If cross_validation=True an additional training with cross validation will be performed.
     """
-    from time import time
+    from joblib import Parallel, delayed
     from sklearn.linear_model import LinearRegression
     from sklearn.linear_model import BayesianRidge
     from sklearn.tree import DecisionTreeRegressor
@@ -1186,7 +1355,7 @@ def ml_regression(x_train,
 
     regressors = (LinearRegression(), BayesianRidge(), DecisionTreeRegressor(),
                   KNeighborsRegressor(n_neighbors=10), AdaBoostRegressor(),
-                  RandomForestRegressor(100))
+                  RandomForestRegressor(100, n_jobs=1))
 
     names = [
         "Linear", "Bayesian Ridge", "Decision Tree", "KNeighbors", "AdaBoost",
@@ -1194,20 +1363,20 @@ def ml_regression(x_train,
     ]
 
     col = ['Time (s)', 'Test loss', 'Test R2 score']
-    results = pd.DataFrame(columns=col)
+    rows = []
+
+    # Fitting the models without cross validation
+    fitted = Parallel(n_jobs=n_jobs)(
+        delayed(_fit_predict)(clf, x_train, y_train, x_test)
+        for clf in regressors)
 
-    for idx, clf in enumerate(regressors):
+    for name, (train_time, y_pred) in zip(names, fitted):
 
-        name = names[idx]
         # clf_cv = clone(clf)
 
         print(name)
 
-        t0 = time()
-        # Fitting the model without cross validation
-        clf.fit(x_train, y_train)
-        train_time = np.around(time() - t0, 1)
-        y_pred = clf.predict(x_test)
+        train_time = np.around(train_time, 1)
 
         loss, r2 = regression_scores(y_test, y_pred, show=show)
 
@@ -1228,8 +1397,7 @@ def ml_regression(x_train,
             # print("Test R2-Score CV:\t {:.3f}".format(r2_cv))
             # print( "Training Time CV: \t {:.1f} ms".format(train_time_cv * 1000))
 
-        results = results.append(
-            pd.DataFrame([[train_time, loss, r2]], columns=col, index=[name]))
+        rows.append([train_time, loss, r2])
 
         if show:
             print("-" * 20)
@@ -1237,14 +1405,15 @@ def ml_regression(x_train,
             print("Test loss:  \t\t {:.4f}".format(loss))
             print("Test R2-score:  \t {:.3f}\n".format(r2))
 
+    results = pd.DataFrame(rows, columns=col, index=names)
+
     return results.sort_values('Test loss').round(2)
 
 
 def binary_classification_scores(y_test, y_pred, return_dataframe=False, index=" ", show=True):
     """ Return classification metrics: log_loss, acc, precision, recall, roc_auc, F1 score """
 
-    from sklearn.metrics import log_loss, accuracy_score, precision_score, recall_score
-    from sklearn.metrics import roc_auc_score, f1_score, confusion_matrix
+    from sklearn.metrics import log_loss, roc_auc_score, confusion_matrix
 
     rec, roc, f1 = 0, 0, 0
 
@@ -1256,19 +1425,17 @@ def binary_classification_scores(y_test, y_pred, return_dataframe=False, index="
         "ignore", message="invalid value encountered in multiply")
     loss = log_loss(y_test, y_pred)
 
-    acc = accuracy_score(y_test, y_pred_b)
+    # accuracy, precision, recall and F1 score from a single confusion matrix
+    cm = confusion_matrix(y_test, y_pred_b, labels=[0, 1])
+    (tn, fp), (fn, tp) = cm
 
-    warnings.filterwarnings(
-        "ignore",
-        message=
-        "Precision is ill-defined and being set to 0.0 due to no predicted samples"
-    )
-    pre = precision_score(y_test, y_pred_b)
+    acc = (tp + tn) / cm.sum()
+    pre = tp / (tp + fp) if tp + fp > 0 else 0  # ill-defined without predicted samples
 
     if acc > 0 and pre > 0:
-        rec = recall_score(y_test, y_pred_b)
+        rec = tp / (tp + fn)
         roc = roc_auc_score(y_test, y_pred)
-        f1 = f1_score(y_test, y_pred_b)
+        f1 = 2 * tp / (2 * tp + fp + fn)
 
     if show:
     #     print('Scores:\n' + '-' * 11)
@@ -1278,7 +1445,7 @@ def binary_classification_scores(y_test, y_pred, return_dataframe=False, index="
     #     print('Recall: \t{:.2f}'.format(rec))
     #     print('ROC AUC: \t{:.2f}'.format(roc))
     #     print('F1-score: \t{:.2f}'.format(f1))
-        print('\nConfusion matrix: \n', confusion_matrix(y_test, y_pred_b))
+        print('\nConfusion matrix: \n', cm)
 
     if return_dataframe:
         col = ['Loss', 'Accuracy', 'Precision', 'Recall', 'ROC-AUC','F1-score']